@@ -1,24 +1,157 @@
 import cv2
 import numpy as np
 import logging
+import os
+import threading
 
 logger = logging.getLogger(__name__)
 
-def detect_wetness(img) -> float:
+# libjpeg-turbo can decode JPEGs at 1/2, 1/4 or 1/8 scale, skipping most of
+# the IDCT work, and can output grayscale directly so no color conversion
+# is needed. Fall back to cv2.imdecode when it is not installed.
+try:
+    from turbojpeg import TurboJPEG, TJPF_GRAY
+    _tj = TurboJPEG()
+except Exception as e:
+    logger.warning("TurboJPEG unavailable, falling back to cv2.imdecode: %s", e)
+    _tj = None
+
+# Frames are downsampled so their longest side is at most this many pixels
+# before analysis. The Otsu sun/shadow ratios are essentially unaffected,
+# but averaging pixels removes fine detail and lowers the contrast behind
+# the wetness score. The drop depends on the scene and on how far the
+# source is reduced, so larger source frames lose more. 0 disables
+# downsampling and restores full-resolution scoring.
+MAX_ANALYSIS_DIM = int(os.getenv("CV_ANALYSIS_MAX_DIM", "400"))
+
+# Scratch arrays reused across frames to avoid reallocating per call.
+# Keyed by shape as well as name, so webcams with different frame sizes
+# each keep their own buffers instead of reallocating one in turn.
+# Thread-local so analyses running in a thread pool never share a buffer.
+_scratch = threading.local()
+_MAX_SCRATCH_BUFFERS = 32
+
+def scratch_buffer(name: str, shape: tuple) -> np.ndarray:
+    """Returns a reusable uint8 buffer of the given shape for this thread."""
+    buffers = getattr(_scratch, "buffers", None)
+    if buffers is None:
+        buffers = _scratch.buffers = {}
+    key = (name, shape)
+    buf = buffers.get(key)
+    if buf is None:
+        if len(buffers) >= _MAX_SCRATCH_BUFFERS:
+            buffers.clear()
+        buf = buffers[key] = np.empty(shape, np.uint8)
+    return buf
+
+def downsample(img):
+    """Shrinks an image so its longest side fits MAX_ANALYSIS_DIM."""
+    height, width = img.shape[:2]
+    longest = max(height, width)
+    if MAX_ANALYSIS_DIM <= 0 or longest <= MAX_ANALYSIS_DIM:
+        return img
+    scale = MAX_ANALYSIS_DIM / longest
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    dst = scratch_buffer("resized", (size[1], size[0]) + img.shape[2:])
+    # INTER_AREA averages source pixels, which preserves mean brightness and the Otsu split
+    return cv2.resize(img, size, dst=dst, interpolation=cv2.INTER_AREA)
+
+# Reduced-size decode modes of cv2.imdecode, keyed by scale denominator
+_CV2_REDUCED_FLAGS = {
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+
+def _jpeg_size(data: bytes):
+    """Reads (width, height) from a JPEG's SOF marker, or None if not found."""
+    i = 2
+    while i + 9 <= len(data) and data[i] == 0xFF:
+        marker = data[i + 1]
+        if marker == 0xFF:
+            # Fill byte before a marker
+            i += 1
+            continue
+        # SOF0-SOF15, excluding DHT, JPG and DAC which share the range
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height = int.from_bytes(data[i + 5:i + 7], "big")
+            width = int.from_bytes(data[i + 7:i + 9], "big")
+            return width, height
+        i += 2 + int.from_bytes(data[i + 2:i + 4], "big")
+    return None
+
+def _jpeg_scaling_factor(width: int, height: int, factors):
+    """Picks the smallest decode scale in factors that still covers MAX_ANALYSIS_DIM."""
+    longest = max(width, height)
+    if MAX_ANALYSIS_DIM <= 0 or longest <= MAX_ANALYSIS_DIM:
+        return None
+    best = None
+    for num, denom in factors:
+        if num < denom and longest * num / denom >= MAX_ANALYSIS_DIM:
+            if best is None or num / denom < best[0] / best[1]:
+                best = (num, denom)
+    return best
+
+def decode_grayscale(image_bytes: bytes):
+    """
+    Decodes image bytes straight into a 2D grayscale array.
+    JPEGs are decoded at reduced scale, with TurboJPEG when available
+    and otherwise with OpenCV's IMREAD_REDUCED_GRAYSCALE_* modes.
+    """
+    is_jpeg = image_bytes[:2] == b"\xff\xd8"
+    if _tj is not None and is_jpeg:
+        width, height, _, _ = _tj.decode_header(image_bytes)
+        gray = _tj.decode(
+            image_bytes,
+            pixel_format=TJPF_GRAY,
+            scaling_factor=_jpeg_scaling_factor(width, height, _tj.scaling_factors),
+        )
+        # Drop the single channel axis
+        return gray[:, :, 0]
+
+    flags = cv2.IMREAD_GRAYSCALE
+    size = _jpeg_size(image_bytes) if is_jpeg else None
+    if size:
+        factor = _jpeg_scaling_factor(*size, [(1, denom) for denom in _CV2_REDUCED_FLAGS])
+        if factor:
+            flags = _CV2_REDUCED_FLAGS[factor[1]]
+
+    # Convert bytes to numpy array
+    nparr = np.frombuffer(image_bytes, np.uint8)
+    return cv2.imdecode(nparr, flags)
+
+def otsu_threshold(hist) -> int:
+    """
+    Computes Otsu's threshold from a 256-bin grayscale histogram.
+    Matches cv2.THRESH_OTSU: pixels above the returned level are foreground.
+    """
+    p = hist / hist.sum()
+    omega = np.cumsum(p)
+    mu = np.cumsum(p * np.arange(256))
+    mu_total = mu[-1]
+
+    # Between-class variance for every candidate threshold at once
+    denom = omega * (1.0 - omega)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sigma_b2 = np.where(denom > 0, (mu_total * omega - mu) ** 2 / denom, 0.0)
+    return int(np.argmax(sigma_b2))
+
+def detect_wetness(hist) -> float:
     """
     Heuristic to detect wetness based on reflections.
+    Expects the 256-bin histogram of the grayscale image.
     Returns a probability between 0 and 1.
     """
-    # Convert to grayscale
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    
-    # Calculate standard deviation of pixel intensities
+    # Calculate standard deviation of pixel intensities from the histogram
     # Wet surfaces often have high contrast (bright reflections vs dark wet asphalt)
-    mean, std_dev = cv2.meanStdDev(gray)
+    levels = np.arange(256)
+    p = hist / hist.sum()
+    mean = float(np.dot(p, levels))
+    std_dev = float(np.sqrt(np.dot(p, (levels - mean) ** 2)))
     
     # Normalize std_dev to a 0-1 range (heuristic)
     # Assume std_dev > 80 is very high contrast (wet/sunny reflections)
-    wetness_score = min(std_dev[0][0] / 80.0, 1.0)
+    wetness_score = min(std_dev / 80.0, 1.0)
     
     return round(wetness_score, 2)
 
@@ -28,32 +161,31 @@ def analyze_image(image_bytes: bytes) -> dict:
     Returns a dictionary with analysis results.
     """
     try:
-        # Convert bytes to numpy array
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        
-        # Decode image
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        # Decode image directly as grayscale, skipping any color conversion
+        gray = decode_grayscale(image_bytes)
         
-        if img is None:
+        if gray is None:
             logger.error("Failed to decode image")
             return None
 
-        # Convert to grayscale
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        gray = downsample(gray)
         
-        # Apply threshold to separate sun (bright) and shadow (dark)
-        # We use Otsu's binarization for automatic thresholding
-        ret, thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        # Separate sun (bright) and shadow (dark) with Otsu's threshold.
+        # The threshold, the pixel counts and the contrast used for wetness
+        # all come from this one histogram, the only pass over the image.
+        hist = cv2.calcHist([gray], [0], None, [256], [0, 256]).ravel().astype(np.float64)
+        threshold = otsu_threshold(hist)
         
         # Count pixels
-        total_pixels = thresh.size
-        sun_pixels = cv2.countNonZero(thresh)
+        total_pixels = gray.size
+        sun_pixels = int(hist[threshold + 1:].sum())
         shadow_pixels = total_pixels - sun_pixels
         
         sun_ratio = sun_pixels / total_pixels
         shadow_ratio = shadow_pixels / total_pixels
         
-        wetness = detect_wetness(img)
+        # Contrast comes from the same histogram, no further pass over the image
+        wetness = detect_wetness(hist)
         
         return {
             "sun_exposure": round(sun_ratio, 2),
@@ -63,5 +195,5 @@ def analyze_image(image_bytes: bytes) -> dict:
         }
         
     except Exception as e:
-        logger.error(f"Error analyzing image: {e}")
+        logger.error("Error analyzing image: %s", e)
         return None
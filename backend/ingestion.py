@@ -1,7 +1,10 @@
 import aiohttp
 import asyncio
+import hashlib
 import logging
-from typing import List, Dict
+import re
+from concurrent.futures import Executor
+from typing import List, Dict, Optional, Tuple
 from cv_module import analyze_image
 
 logger = logging.getLogger(__name__)
@@ -25,41 +28,161 @@ WEBCAMS = [
     }
 ]
 
-async def fetch_image(session: aiohttp.ClientSession, url: str) -> bytes:
-    """Fetches an image from a URL."""
+# Digest of the last analysed frame and its result, keyed by webcam id.
+# Webcams often serve the same JPEG for several cycles, so identical bytes
+# can reuse the previous analysis instead of being decoded again.
+_last_analysis: Dict[str, Tuple[bytes, Dict]] = {}
+
+# Sentinel returned by fetch_image when the server answers 304 Not Modified
+NOT_MODIFIED = object()
+
+# Conditional request headers built from each webcam's last 200 response
+_validators: Dict[str, Dict[str, str]] = {}
+
+# Polling interval bounds for a single webcam, in seconds. A webcam is polled
+# every DEFAULT_INTERVAL unless its Cache-Control max-age asks for less often.
+DEFAULT_INTERVAL = 60
+MAX_INTERVAL = 600
+
+# Last Cache-Control max-age advertised by each webcam
+_max_age: Dict[str, int] = {}
+
+_MAX_AGE_RE = re.compile(r"max-age=(\d+)")
+
+def poll_interval(cam: Dict) -> int:
+    """Returns how long to wait before fetching this webcam again."""
+    max_age = _max_age.get(cam["id"], 0)
+    return min(max(max_age, DEFAULT_INTERVAL), MAX_INTERVAL)
+
+async def fetch_image(session: aiohttp.ClientSession, cam: Dict) -> object:
+    """
+    Fetches a webcam's image.
+    Once the webcam has been analysed, the request is made conditional on
+    the last ETag/Last-Modified, and NOT_MODIFIED is returned on a 304.
+    Returns the image bytes, NOT_MODIFIED, or None on failure.
+    """
+    url = cam["url"]
+    headers = _validators.get(cam["id"], {}) if cam["id"] in _last_analysis else {}
     try:
-        async with session.get(url) as response:
-            if response.status == 200:
+        async with session.get(url, headers=headers) as response:
+            match = _MAX_AGE_RE.search(response.headers.get("Cache-Control", ""))
+            if match:
+                _max_age[cam["id"]] = int(match.group(1))
+            else:
+                _max_age.pop(cam["id"], None)
+
+            if response.status == 304:
+                return NOT_MODIFIED
+            elif response.status == 200:
+                validators = {}
+                if "ETag" in response.headers:
+                    validators["If-None-Match"] = response.headers["ETag"]
+                if "Last-Modified" in response.headers:
+                    validators["If-Modified-Since"] = response.headers["Last-Modified"]
+                _validators[cam["id"]] = validators
                 return await response.read()
             else:
-                logger.error(f"Failed to fetch image from {url}: Status {response.status}")
+                logger.error("Failed to fetch image from %s: Status %s", url, response.status)
                 return None
     except Exception as e:
-        logger.error(f"Error fetching {url}: {e}")
+        logger.error("Error fetching %s: %s", url, e)
         return None
 
-async def ingest_all_webcams() -> List[Dict]:
-    """Fetches images from all configured webcams and analyzes them."""
+def create_session() -> aiohttp.ClientSession:
+    """
+    Creates the HTTP session used for webcam fetches.
+    It is meant to be kept for the lifetime of the app so keep-alive
+    connections, TLS sessions and DNS lookups are reused across cycles.
+    """
+    connector = aiohttp.TCPConnector(
+        limit=100,
+        limit_per_host=4,
+        ttl_dns_cache=300,
+        keepalive_timeout=120,
+    )
+    return aiohttp.ClientSession(connector=connector)
+
+async def process_webcam(session: aiohttp.ClientSession, cam: Dict, executor: Optional[Executor] = None) -> Optional[Dict]:
+    """
+    Fetches and analyzes a single webcam.
+    Returns the webcam data merged with its analysis, or None on failure.
+    """
+    img = await fetch_image(session, cam)
+    cached = _last_analysis.get(cam["id"])
+    if img is NOT_MODIFIED and cached:
+        logger.debug("Image not modified for %s", cam["name"])
+        digest = cached[0]
+    elif img and img is not NOT_MODIFIED:
+        logger.debug("Successfully fetched image for %s", cam["name"])
+        digest = hashlib.blake2b(img, digest_size=16).digest()
+    else:
+        # A 304 with nothing cached to reuse is as good as a failed fetch
+        logger.warning("Failed to fetch image for %s", cam["name"])
+        _validators.pop(cam["id"], None)
+        return None
+
+    if cached and cached[0] == digest:
+        logger.debug("Image unchanged for %s, reusing analysis", cam["name"])
+        analysis = cached[1]
+    else:
+        loop = asyncio.get_running_loop()
+        analysis = await loop.run_in_executor(executor, analyze_image, img)
+
+    if not analysis:
+        # Fetch the full image next time rather than revalidating one we could not analyse
+        _validators.pop(cam["id"], None)
+        return None
+
+    _last_analysis[cam["id"]] = (digest, analysis)
+    data = cam.copy()
+    data.update(analysis)
+    logger.debug("Analysis for %s: %s", cam["name"], analysis)
+    return data
+
+async def ingest_all_webcams(session: aiohttp.ClientSession, executor: Optional[Executor] = None) -> List[Dict]:
+    """
+    Fetches images from all configured webcams and analyzes them.
+    Each webcam is analyzed as soon as its own image arrives, in the given
+    executor (the loop's default one if None), so decoding overlaps with
+    the remaining fetches and never blocks the event loop.
+    """
+    tasks = [process_webcam(session, cam, executor) for cam in WEBCAMS]
+    results = await asyncio.gather(*tasks)
+    return [data for data in results if data]
+
+def latest_results() -> List[Dict]:
+    """Returns every webcam merged with its most recent analysis, skipping those without one."""
     results_data = []
-    async with aiohttp.ClientSession() as session:
-        tasks = [fetch_image(session, cam["url"]) for cam in WEBCAMS]
-        images = await asyncio.gather(*tasks)
-        
-        for i, img in enumerate(images):
-            if img:
-                logger.info(f"Successfully fetched image for {WEBCAMS[i]['name']}")
-                analysis = analyze_image(img)
-                if analysis:
-                    data = WEBCAMS[i].copy()
-                    data.update(analysis)
-                    # Remove binary data if any (url is fine)
-                    results_data.append(data)
-                    logger.info(f"Analysis for {WEBCAMS[i]['name']}: {analysis}")
-            else:
-                logger.warning(f"Failed to fetch image for {WEBCAMS[i]['name']}")
+    for cam in WEBCAMS:
+        cached = _last_analysis.get(cam["id"])
+        if cached:
+            data = cam.copy()
+            data.update(cached[1])
+            results_data.append(data)
     return results_data
 
+async def watch_webcam(session: aiohttp.ClientSession, cam: Dict, queue: asyncio.Queue, executor: Optional[Executor] = None):
+    """
+    Polls a single webcam forever on its own schedule.
+    Results are pushed onto the queue for broadcasting only when the
+    frame changed; clients get unchanged state from latest_results.
+    """
+    while True:
+        try:
+            previous = _last_analysis.get(cam["id"])
+            data = await process_webcam(session, cam, executor)
+            if data and (previous is None or previous[0] != _last_analysis[cam["id"]][0]):
+                await queue.put(data)
+        except Exception as e:
+            logger.error("Error processing %s: %s", cam["name"], e)
+
+        await asyncio.sleep(poll_interval(cam))
+
 if __name__ == "__main__":
     # Test run
+    async def main():
+        async with create_session() as session:
+            await ingest_all_webcams(session)
+
     logging.basicConfig(level=logging.INFO)
-    asyncio.run(ingest_all_webcams())
+    asyncio.run(main())
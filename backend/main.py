@@ -2,14 +2,41 @@ from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 import asyncio
 import logging
-from typing import List
-from ingestion import ingest_all_webcams
+import multiprocessing
+import os
+import orjson
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Set
+from ingestion import WEBCAMS, create_session, latest_results, watch_webcam
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Urban Micro-Climate Map API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One HTTP session for the app's lifetime keeps connections warm between cycles
+    async with create_session() as session:
+        # Image analysis is CPU-bound, so spread it over worker processes.
+        # More workers than webcams would only sit idle.
+        # Workers start lazily from a process already running threads, so
+        # spawn them fresh rather than forking that state.
+        workers = int(os.getenv("CV_WORKERS", "0")) or max(1, min(os.cpu_count() or 1, len(WEBCAMS)))
+        mp_context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context) as executor:
+            app.state.http_session = session
+            app.state.cv_executor = executor
+            # Each webcam is polled on its own schedule, results are broadcast as they arrive
+            queue = asyncio.Queue()
+            tasks = [asyncio.create_task(watch_webcam(session, cam, queue, executor)) for cam in WEBCAMS]
+            tasks.append(asyncio.create_task(background_task(queue)))
+            yield
+            for task in tasks:
+                task.cancel()
+            executor.shutdown(cancel_futures=True)
+
+app = FastAPI(title="Urban Micro-Climate Map API", lifespan=lifespan)
 
 # CORS configuration
 app.add_middleware(
@@ -22,21 +49,28 @@ app.add_middleware(
 
 class ConnectionManager:
     def __init__(self):
-        self.active_connections: List[WebSocket] = []
+        self.active_connections: Set[WebSocket] = set()
 
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
-        self.active_connections.append(websocket)
+        self.active_connections.add(websocket)
 
     def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
+        # discard, as a failed broadcast may already have dropped this connection
+        self.active_connections.discard(websocket)
 
-    async def broadcast(self, message: dict):
-        for connection in self.active_connections:
-            try:
-                await connection.send_json(message)
-            except Exception as e:
-                logger.error(f"Error sending message: {e}")
+    async def broadcast(self, payload: str):
+        """Sends an already serialized JSON message to all clients concurrently."""
+        # Snapshot so connects/disconnects during the sends don't affect this broadcast
+        connections = tuple(self.active_connections)
+        results = await asyncio.gather(
+            *(connection.send_text(payload) for connection in connections),
+            return_exceptions=True,
+        )
+        for connection, result in zip(connections, results):
+            if isinstance(result, Exception):
+                logger.error("Error sending message: %s", result)
+                self.disconnect(connection)
 
 manager = ConnectionManager()
 
@@ -47,27 +81,29 @@ async def root():
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await manager.connect(websocket)
+    # Updates are only broadcast when a webcam changes, so send new clients
+    # the current state right away instead of waiting for the next change
+    snapshot = latest_results()
     try:
+        if snapshot:
+            await websocket.send_text(orjson.dumps({"type": "update", "data": snapshot}).decode())
         while True:
             await websocket.receive_text()
     except WebSocketDisconnect:
         manager.disconnect(websocket)
     except Exception as e:
-        logger.error(f"WebSocket error: {e}")
+        logger.error("WebSocket error: %s", e)
         manager.disconnect(websocket)
 
-async def background_task():
+async def background_task(queue: asyncio.Queue):
     while True:
+        data = [await queue.get()]
+        # Batch results from webcams that finished around the same time
+        while not queue.empty():
+            data.append(queue.get_nowait())
         try:
-            logger.info("Starting ingestion cycle...")
-            data = await ingest_all_webcams()
-            await manager.broadcast({"type": "update", "data": data})
-            logger.info("Broadcasted update")
+            # Serialize once here, every client receives the same text
+            await manager.broadcast(orjson.dumps({"type": "update", "data": data}).decode())
+            logger.info("Broadcasted update for %d webcam(s)", len(data))
         except Exception as e:
-            logger.error(f"Error in background task: {e}")
-        
-        await asyncio.sleep(60) # Update every minute
-
-@app.on_event("startup")
-async def startup_event():
-    asyncio.create_task(background_task())
+            logger.error("Error in background task: %s", e)